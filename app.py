@@ -1,7 +1,14 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify
-from leave_analyzer import analyze_leave_request
+from flask import Flask, render_template, request, redirect, url_for, jsonify, Response
+from leave_analyzer import analyze_leave_request, get_all_rules_info, get_rule_plan
+from leave_history import get_history_index, DEFAULT_PAGE_SIZE
+from live_stats import LiveStats, KEEPALIVE_INTERVAL
+from request_profiler import init_profiling
 import csv
+import io
+import json
 import os
+import queue
+import zlib
 from datetime import datetime
 
 app = Flask(__name__)
@@ -12,11 +19,53 @@ if not os.path.exists('dataset'):
 
 # Initialize CSV file with headers if it doesn't exist
 csv_file = 'dataset/leave_requests.csv'
+# Rules holds the '; '-joined ids of the rules that flagged the request
+CSV_FIELDS = ['Timestamp', 'Employee Name', 'Employee ID', 'Department',
+              'Reason', 'Start Date', 'End Date', 'Duration', 'Status', 'Flags', 'Rules']
+
+def upgrade_csv_columns(path):
+    """
+    Add any CSV_FIELDS columns missing from an existing CSV, left empty for
+    the rows already stored. The file is rewritten once and swapped in place.
+    """
+    # surrogateescape copies bytes that are not valid UTF-8 through unchanged
+    with open(path, 'r', newline='', encoding='utf-8', errors='surrogateescape') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        missing = [field for field in CSV_FIELDS if field not in header]
+        if not missing:
+            return
+
+        print(f"Adding column(s) {', '.join(missing)} to {path}")
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', newline='', encoding='utf-8', errors='surrogateescape') as out:
+            writer = csv.writer(out)
+            writer.writerow(header + missing)
+            for values in reader:
+                # Malformed rows are copied as they are and still skipped on read
+                if len(values) == len(header):
+                    values += [''] * len(missing)
+                writer.writerow(values)
+    os.replace(temp_path, path)
+
 if not os.path.exists(csv_file):
     with open(csv_file, 'w', newline='', encoding='utf-8') as f:
         writer = csv.writer(f)
-        writer.writerow(['Timestamp', 'Employee Name', 'Employee ID', 'Department', 
-                        'Reason', 'Start Date', 'End Date', 'Duration', 'Status', 'Flags'])
+        writer.writerow(CSV_FIELDS)
+else:
+    upgrade_csv_columns(csv_file)
+
+# Export responses are flushed to the client in chunks of roughly this size
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# Secondary indexes for browsing past requests (built lazily on first query);
+# shared with the similar-reason rule, which uses them to find its window
+history_index = get_history_index(csv_file)
+
+# Running statistics shared by /stats and all /stats/stream subscribers
+live_stats = LiveStats(csv_file)
 
 def get_employee_leave_history(employee_id, start_date):
     """
@@ -31,7 +80,7 @@ def get_employee_leave_history(employee_id, start_date):
         start_year = datetime.strptime(start_date, '%Y-%m-%d').year
         
         leave_count = 0
-        with open(csv_file, 'r', encoding='utf-8') as f:
+        with open(csv_file, 'r', encoding='utf-8', errors='replace') as f:
             reader = csv.DictReader(f)
             for row in reader:
                 if row['Employee ID'] == employee_id:
@@ -55,7 +104,7 @@ def get_employee_info(employee_id):
         return None
     
     try:
-        with open(csv_file, 'r', encoding='utf-8') as f:
+        with open(csv_file, 'r', encoding='utf-8', errors='replace') as f:
             reader = csv.DictReader(f)
             for row in reader:
                 if row['Employee ID'] == employee_id:
@@ -79,6 +128,88 @@ def validate_dates(start_date, end_date):
     except ValueError:
         return False, "Invalid date format"
 
+def parse_leave_filters(args):
+    """
+    Build leave record filters from query string arguments
+
+    Supported arguments: employee_id, name (employee name prefix), department,
+    status, rule, start_date and end_date (YYYY-MM-DD, matches leaves
+    overlapping the range)
+
+    Returns:
+        tuple: (filters dict, error message or None)
+    """
+    filters = {}
+    for arg, field in (('employee_id', 'Employee ID'), ('department', 'Department'), ('status', 'Status')):
+        value = args.get(arg, '').strip()
+        if value:
+            filters[field] = value
+
+    name = args.get('name', '').strip()
+    if name:
+        filters['name'] = name.lower()
+
+    for arg in ('start_date', 'end_date'):
+        value = args.get(arg, '').strip()
+        if value:
+            try:
+                datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                return None, f"Invalid {arg} - please use YYYY-MM-DD"
+            filters[arg] = value
+
+    rule = args.get('rule', '').strip()
+    if rule:
+        if rule not in get_rule_plan().flag_patterns:
+            return None, f"Unknown rule: {rule}"
+        filters['rule'] = rule
+
+    return filters, None
+
+def row_matches_filters(row, filters, plan=None):
+    """Check a CSV row against filters from parse_leave_filters, cheapest checks first"""
+    for field in ('Employee ID', 'Department', 'Status'):
+        if field in filters and row[field] != filters[field]:
+            return False
+    if 'name' in filters and not row['Employee Name'].lower().startswith(filters['name']):
+        return False
+
+    # ISO dates compare correctly as strings, so no parsing is needed
+    if 'start_date' in filters and row['End Date'] < filters['start_date']:
+        return False
+    if 'end_date' in filters and row['Start Date'] > filters['end_date']:
+        return False
+
+    if 'rule' in filters:
+        plan = plan or get_rule_plan()
+        if filters['rule'] not in plan.rules_in_record(row):
+            return False
+    return True
+
+def iter_leave_records(filters):
+    """
+    Stream leave records matching filters from the CSV, one row at a time
+    """
+    if not os.path.exists(csv_file):
+        return
+
+    plan = get_rule_plan() if 'rule' in filters else None
+
+    # Selective employee, department, status or name filters read only the
+    # candidate rows located by the history index instead of the whole file
+    rows = history_index.iter_matching_rows(filters)
+    if rows is not None:
+        for row in rows:
+            if row_matches_filters(row, filters, plan):
+                yield row
+        return
+
+    # A stray non-UTF-8 byte must not abort the stream halfway through
+    with open(csv_file, 'r', newline='', encoding='utf-8', errors='replace') as f:
+        for row in csv.DictReader(f):
+            if row_matches_filters(row, filters, plan):
+                yield row
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -107,17 +238,24 @@ def submit_leave():
     existing_employee = get_employee_info(employee_id)
     is_new_employee = existing_employee is None
     
-    # Get employee's leave history for Rule 3
-    previous_leaves = get_employee_leave_history(employee_id, start_date)
-    
+    # Employee's leave history for Rule 3 is scanned lazily, only if the rule
+    # is enabled and reached; new employees have no history to scan
+    if is_new_employee:
+        previous_leaves_count = 0
+    else:
+        previous_leaves_count = lambda: get_employee_leave_history(employee_id, start_date)
+
     # Analyze the leave request
     result = analyze_leave_request(
         reason=reason,
         start_date=start_date,
         end_date=end_date,
         department=department,
-        previous_leaves_count=previous_leaves
+        previous_leaves_count=previous_leaves_count,
+        employee_id=employee_id
     )
+    # None when no rule needed the history, so the scan never ran
+    previous_leaves = result['previous_leaves_count']
     
     # Save to CSV
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -134,12 +272,14 @@ def submit_leave():
                 end_date,
                 result['duration'],
                 result['status'],
-                '; '.join(result['reasons'])
+                '; '.join(result['reasons']),
+                '; '.join(str(rule_id) for rule_id in result['rules_triggered'])
             ])
     except Exception as e:
         print(f"Error saving to CSV: {e}")
         return render_template('error.html', 
                              message="Error saving request. Please try again.")
+    live_stats.notify()
     
     # Render result page with additional info
     return render_template('result.html', 
@@ -156,36 +296,39 @@ def statistics():
         return render_template('stats.html', stats=None)
     
     try:
-        with open(csv_file, 'r', encoding='utf-8') as f:
-            reader = list(csv.DictReader(f))
-            
-            total_requests = len(reader)
-            approved = sum(1 for r in reader if r['Status'] == 'Approved')
-            flagged = sum(1 for r in reader if r['Status'] == 'Flagged')
-            
-            # Get unique employees
-            unique_employees = len(set(r['Employee ID'] for r in reader))
-            
-            # Department breakdown
-            dept_stats = {}
-            for row in reader:
-                dept = row['Department']
-                dept_stats[dept] = dept_stats.get(dept, 0) + 1
-            
-            stats = {
-                'total_requests': total_requests,
-                'approved': approved,
-                'flagged': flagged,
-                'approval_rate': round((approved / total_requests * 100), 1) if total_requests > 0 else 0,
-                'unique_employees': unique_employees,
-                'departments': dept_stats
-            }
-            
-            return render_template('stats.html', stats=stats)
+        # Aggregates are maintained incrementally, so this only reads rows
+        # appended since the last request
+        stats = live_stats.snapshot()
+        return render_template('stats.html', stats=stats, rules_info=get_all_rules_info())
     except Exception as e:
         print(f"Error generating stats: {e}")
         return render_template('stats.html', stats=None)
 
+@app.route('/stats/stream')
+def stats_stream():
+    """
+    Server-Sent Events stream of live statistics
+
+    Sends a 'snapshot' event with the full statistics on connect, then
+    'delta' events with only the changed values as requests are submitted.
+    """
+    subscriber = live_stats.subscribe()
+
+    def generate():
+        try:
+            while True:
+                try:
+                    event, data = subscriber.get(timeout=KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            live_stats.unsubscribe(subscriber)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/check-employee/<employee_id>')
 def check_employee(employee_id):
     """API endpoint to check if employee exists"""
@@ -194,6 +337,123 @@ def check_employee(employee_id):
         return jsonify({'exists': True, 'info': info})
     return jsonify({'exists': False})
 
+def search_leave_history(args):
+    """
+    Run a history search from query string arguments
+
+    Returns:
+        tuple: (page dict from LeaveHistoryIndex.search, error message or None)
+    """
+    filters, error = parse_leave_filters(args)
+    if error:
+        return None, error
+
+    try:
+        page_size = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return None, "limit must be a number"
+
+    # Rule hits are not indexed; check them against the full row instead
+    row_filter = None
+    if 'rule' in filters:
+        plan = get_rule_plan()
+        row_filter = lambda row: filters['rule'] in plan.rules_in_record(row)
+
+    try:
+        page = history_index.search(filters, cursor=args.get('cursor') or None,
+                                    page_size=page_size, row_filter=row_filter)
+    except ValueError as e:
+        return None, str(e)
+    return page, None
+
+@app.route('/history')
+def history():
+    """Browse past leave requests"""
+    page, error = search_leave_history(request.args)
+    if error:
+        return render_template('error.html', message=error)
+
+    # Query string for the next page link, keeping the current filters
+    next_args = None
+    if page['next_cursor']:
+        next_args = {k: v for k, v in request.args.items() if k != 'cursor' and v}
+        next_args['cursor'] = page['next_cursor']
+
+    return render_template('history.html',
+                         records=page['records'],
+                         filters=request.args,
+                         next_url=url_for('history', **next_args) if next_args else None)
+
+@app.route('/api/history')
+def api_history():
+    """
+    API endpoint for browsing past leave requests, newest first
+
+    Accepts the filters from parse_leave_filters, plus limit (page size)
+    and cursor (next_cursor from the previous response)
+    """
+    page, error = search_leave_history(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+    return jsonify({
+        'records': page['records'],
+        'count': len(page['records']),
+        'next_cursor': page['next_cursor']
+    })
+
+@app.route('/api/export')
+def export_leaves():
+    """
+    Stream filtered leave history as CSV or NDJSON
+
+    Query parameters: the filters from parse_leave_filters, plus
+    format (csv or ndjson, default csv) and gzip (1 to compress the output)
+    """
+    export_format = request.args.get('format', 'csv').strip().lower()
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    compress = request.args.get('gzip', '').strip().lower() in ('1', 'true', 'yes')
+
+    filters, error = parse_leave_filters(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+
+    def generate_text():
+        buffer = io.StringIO()
+        if export_format == 'csv':
+            writer = csv.writer(buffer)
+            writer.writerow(CSV_FIELDS)
+        for row in iter_leave_records(filters):
+            if export_format == 'csv':
+                writer.writerow([row[field] for field in CSV_FIELDS])
+            else:
+                buffer.write(json.dumps({field: row[field] for field in CSV_FIELDS}))
+                buffer.write('\n')
+            if buffer.tell() >= EXPORT_CHUNK_SIZE:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+
+    def generate_gzip():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header
+        for chunk in generate_text():
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    filename = f"leave_requests.{export_format}"
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    if compress:
+        filename += '.gz'
+        mimetype = 'application/gzip'
+
+    return Response(generate_gzip() if compress else generate_text(),
+                    mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
 @app.errorhandler(404)
 def page_not_found(e):
     return render_template('error.html', message="Page not found"), 404
@@ -202,6 +462,9 @@ def page_not_found(e):
 def internal_error(e):
     return render_template('error.html', message="Internal server error"), 500
 
+# Opt-in request profiling (no-op unless PROFILE_REQUESTS is set)
+init_profiling(app)
+
 if __name__ == '__main__':
     print("=" * 50)
     print("🚀 AI-HR Leave Request Analyzer")
@@ -267,7 +267,8 @@ if __name__ == "__main__":
         analyzed_records.append({
             **record,
             'status': result['status'],
-            'flags': '; '.join(result['reasons'])
+            'flags': '; '.join(result['reasons']),
+            'rules': '; '.join(str(rule_id) for rule_id in result['rules_triggered'])
         })
         
         if (i + 1) % 50 == 0:
@@ -280,7 +281,7 @@ if __name__ == "__main__":
     with open(output_file, 'w', newline='', encoding='utf-8') as f:
         writer = csv.writer(f)
         writer.writerow(['Timestamp', 'Employee Name', 'Employee ID', 'Department', 
-                        'Reason', 'Start Date', 'End Date', 'Duration', 'Status', 'Flags'])
+                        'Reason', 'Start Date', 'End Date', 'Duration', 'Status', 'Flags', 'Rules'])
         
         for rec in analyzed_records:
             writer.writerow([
@@ -293,7 +294,8 @@ if __name__ == "__main__":
                 rec['end_date'],
                 rec['duration'],
                 rec['status'],
-                rec['flags']
+                rec['flags'],
+                rec['rules']
             ])
     
     # Print statistics
@@ -1,4 +1,17 @@
 from datetime import datetime, timedelta
+import json
+import re
+import os
+import threading
+import weakref
+
+from reason_similarity import ReasonSimilarityIndex
+
+# Rules config file (override with the LEAVE_RULES_CONFIG environment variable)
+RULES_CONFIG_FILE = os.environ.get(
+    'LEAVE_RULES_CONFIG',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules_config.json')
+)
 
 # Public holidays (customize based on your region)
 PUBLIC_HOLIDAYS = [
@@ -17,28 +30,36 @@ PUBLIC_HOLIDAYS = [
     '2026-12-25',  # Christmas
 ]
 
-def analyze_leave_request(reason, start_date, end_date, department, previous_leaves_count=0):
+def analyze_leave_request(reason, start_date, end_date, department, previous_leaves_count=0,
+                          employee_id=None):
     """
     Analyzes a leave request based on multiple rules.
     
+    Rules are defined in the rules config file and compiled once into a rule
+    plan (see get_rule_plan). Cheap checks run first; costly checks such as
+    the employee history and holiday lookups are deferred until the end.
+    
     Args:
         reason (str): Reason for leave request
         start_date (str): Start date in YYYY-MM-DD format
         end_date (str): End date in YYYY-MM-DD format
         department (str): Employee's department
-        previous_leaves_count (int): Number of leaves already taken this month
+        previous_leaves_count (int or callable): Number of leaves already taken
+            this month, or a zero-argument callable returning it. A callable is
+            only invoked if a rule actually needs the count.
+        employee_id (str): Submitting employee, needed by rules that compare
+            against other employees' requests (skipped when not given)
     
     Returns:
         dict: {
             'status': 'Approved' or 'Flagged',
             'reasons': list of reasons if flagged or approval message,
             'duration': number of days,
-            'rules_triggered': list of rule numbers triggered
+            'rules_triggered': list of rule numbers triggered,
+            'previous_leaves_count': the history count if it was given or
+                looked up by a rule, else None
         }
     """
-    flags = []
-    rules_triggered = []
-    
     # Convert dates
     try:
         start = datetime.strptime(start_date, '%Y-%m-%d')
@@ -49,7 +70,8 @@ def analyze_leave_request(reason, start_date, end_date, department, previous_lea
             'status': 'Flagged',
             'reasons': ['Invalid date format - please use YYYY-MM-DD'],
             'duration': 0,
-            'rules_triggered': ['validation_error']
+            'rules_triggered': ['validation_error'],
+            'previous_leaves_count': None
         }
     
     # Validate duration is positive
@@ -58,52 +80,13 @@ def analyze_leave_request(reason, start_date, end_date, department, previous_lea
             'status': 'Flagged',
             'reasons': ['End date must be on or after start date'],
             'duration': 0,
-            'rules_triggered': ['validation_error']
+            'rules_triggered': ['validation_error'],
+            'previous_leaves_count': None
         }
     
-    # Rule 1: Duration more than 7 days
-    if duration > 7:
-        flags.append(f'Leave duration ({duration} days) exceeds 7 days')
-        rules_triggered.append(1)
-    
-    # Rule 2: Keywords like vacation, travel, holiday, trip
-    vacation_keywords = ['vacation', 'travel', 'holiday', 'trip']
-    reason_lower = reason.lower()
-    found_keywords = [kw for kw in vacation_keywords if kw in reason_lower]
-    if found_keywords:
-        flags.append(f'Leave reason contains vacation-related keywords: {", ".join(found_keywords)}')
-        rules_triggered.append(2)
-    
-    # Rule 3: Already taken 3 or more leaves in the same month
-    if previous_leaves_count >= 3:
-        flags.append(f'Employee has already taken {previous_leaves_count} leaves this month (limit: 3)')
-        rules_triggered.append(3)
-    
-    # Rule 4a: Starts on Friday
-    if start.weekday() == 4:  # Friday = 4
-        flags.append('Leave starts on Friday (potential long weekend extension)')
-        rules_triggered.append('4a')
-    
-    # Rule 4b: Ends on Monday
-    if end.weekday() == 0:  # Monday = 0
-        flags.append('Leave ends on Monday (potential long weekend extension)')
-        rules_triggered.append('4b')
-    
-    # Rule 5: Contains "sick" but reason is too short (less than 10 characters)
-    if 'sick' in reason_lower and len(reason) < 10:
-        flags.append(f'Sick leave reason is too brief ({len(reason)} characters, minimum: 10)')
-        rules_triggered.append(5)
-    
-    # Rule 6: IT Support department with leave > 2 days
-    if department == 'IT Support' and duration > 2:
-        flags.append(f'IT Support department leave exceeds 2 days (requested: {duration} days, limit: 2)')
-        rules_triggered.append(6)
-    
-    # Rule 7: Leave is just before or after a public holiday
-    holiday_flags = check_holiday_proximity(start, end, duration)
-    if holiday_flags:
-        flags.extend(holiday_flags)
-        rules_triggered.append(7)
+    context = _RequestContext(reason, start, end, duration, department, previous_leaves_count,
+                              employee_id)
+    flags, rules_triggered = get_rule_plan().evaluate(context)
     
     # Determine status
     status = 'Flagged' if flags else 'Approved'
@@ -123,11 +106,12 @@ def analyze_leave_request(reason, start_date, end_date, department, previous_lea
         'reasons': response_reasons,
         'duration': duration,
         'rules_triggered': rules_triggered,
+        'previous_leaves_count': context.resolved_previous_leaves_count,
         'start_day': start.strftime('%A'),
         'end_day': end.strftime('%A')
     }
 
-def check_holiday_proximity(start, end, duration):
+def check_holiday_proximity(start, end, duration, holidays=None):
     """
     Check if leave is adjacent to or includes public holidays
     
@@ -135,32 +119,42 @@ def check_holiday_proximity(start, end, duration):
         start (datetime): Start date
         end (datetime): End date
         duration (int): Leave duration in days
+        holidays (list): Pre-parsed holidays from _parse_holidays
+            (defaults to PUBLIC_HOLIDAYS)
     
     Returns:
         list: List of holiday-related flags
     """
+    if holidays is None:
+        holidays = _parse_holidays(PUBLIC_HOLIDAYS)
+    
     flags = []
     
-    for holiday_str in PUBLIC_HOLIDAYS:
+    for holiday, holiday_name, holiday_label in holidays:
+        # Check if leave starts immediately after holiday
+        if start == holiday + timedelta(days=1):
+            flags.append(f'Leave starts immediately after {holiday_name} ({holiday_label})')
+        
+        # Check if leave ends immediately before holiday
+        if end == holiday - timedelta(days=1):
+            flags.append(f'Leave ends immediately before {holiday_name} ({holiday_label})')
+        
+        # Check if holiday falls during the leave period
+        if start <= holiday <= end:
+            flags.append(f'Leave period includes {holiday_name} ({holiday_label})')
+    
+    return flags
+
+def _parse_holidays(holiday_strs):
+    """Parse holiday date strings into (datetime, name, label) tuples, skipping invalid dates"""
+    holidays = []
+    for holiday_str in holiday_strs:
         try:
             holiday = datetime.strptime(holiday_str, '%Y-%m-%d')
-            holiday_name = get_holiday_name(holiday_str)
-            
-            # Check if leave starts immediately after holiday
-            if start == holiday + timedelta(days=1):
-                flags.append(f'Leave starts immediately after {holiday_name} ({holiday.strftime("%Y-%m-%d")})')
-            
-            # Check if leave ends immediately before holiday
-            if end == holiday - timedelta(days=1):
-                flags.append(f'Leave ends immediately before {holiday_name} ({holiday.strftime("%Y-%m-%d")})')
-            
-            # Check if holiday falls during the leave period
-            if start <= holiday <= end:
-                flags.append(f'Leave period includes {holiday_name} ({holiday.strftime("%Y-%m-%d")})')
         except ValueError:
             continue
-    
-    return flags
+        holidays.append((holiday, get_holiday_name(holiday_str), holiday.strftime('%Y-%m-%d')))
+    return holidays
 
 def get_holiday_name(date_str):
     """Get holiday name based on date"""
@@ -181,46 +175,384 @@ def get_holiday_name(date_str):
 def get_all_rules_info():
     """
     Returns information about all rules for documentation/display
+    
+    Generated from the same rules config that drives analyze_leave_request.
     """
-    return {
-        'rule_1': {
-            'name': 'Long Duration',
-            'description': 'Leave duration exceeds 7 days',
-            'threshold': '7 days'
-        },
-        'rule_2': {
-            'name': 'Vacation Keywords',
-            'description': 'Reason contains vacation-related keywords',
-            'keywords': ['vacation', 'travel', 'holiday', 'trip']
-        },
-        'rule_3': {
-            'name': 'Frequent Leaves',
-            'description': 'Employee has taken 3 or more leaves in the same month',
-            'threshold': '3 leaves per month'
-        },
-        'rule_4a': {
-            'name': 'Friday Start',
-            'description': 'Leave starts on Friday (potential long weekend)',
-            'day': 'Friday'
-        },
-        'rule_4b': {
-            'name': 'Monday End',
-            'description': 'Leave ends on Monday (potential long weekend)',
-            'day': 'Monday'
-        },
-        'rule_5': {
-            'name': 'Brief Sick Reason',
-            'description': 'Sick leave with insufficient details',
-            'threshold': '10 characters minimum'
-        },
-        'rule_6': {
-            'name': 'IT Support Duration',
-            'description': 'IT Support department leave exceeds limit',
-            'threshold': '2 days for IT Support'
-        },
-        'rule_7': {
-            'name': 'Holiday Proximity',
-            'description': 'Leave is adjacent to or includes public holidays',
-            'check': 'Before, after, or during holidays'
+    return get_rule_plan().info
+
+
+# ---------------------------------------------------------------------------
+# Rule configuration
+#
+# Rules are declared in RULES_CONFIG_FILE and compiled once into a RulePlan of
+# closures. The plan is recompiled automatically when the file changes on
+# disk, so thresholds can be tuned without restarting workers.
+# ---------------------------------------------------------------------------
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Relative cost of each rule type; cheaper rules are evaluated first
+COST_CHEAP = 1
+COST_LOOKUP = 10
+
+
+class _RequestContext:
+    """Per-request values shared by all rule checks"""
+
+    def __init__(self, reason, start, end, duration, department, previous_leaves_count,
+                 employee_id=None):
+        self.reason = reason
+        self.reason_lower = reason.lower()
+        self.start = start
+        self.end = end
+        self.duration = duration
+        self.department = department
+        self.employee_id = employee_id
+        self._previous_leaves_count = previous_leaves_count
+
+    @property
+    def previous_leaves_count(self):
+        """Resolve the (possibly lazy) leave history count on first use"""
+        if callable(self._previous_leaves_count):
+            self._previous_leaves_count = self._previous_leaves_count()
+        return self._previous_leaves_count
+
+    @property
+    def resolved_previous_leaves_count(self):
+        """The leave history count if already known, without triggering a lookup"""
+        if callable(self._previous_leaves_count):
+            return None
+        return self._previous_leaves_count
+
+
+def _require_int(name, value, minimum=0):
+    """Validate an integer rule parameter (bools are rejected)"""
+    if isinstance(value, bool) or not isinstance(value, int) or value < minimum:
+        raise ValueError(f'{name} must be an integer >= {minimum}, got {value!r}')
+    return value
+
+def _require_number(name, value, minimum, maximum):
+    """Validate a numeric rule parameter within [minimum, maximum]"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not minimum <= value <= maximum:
+        raise ValueError(f'{name} must be a number between {minimum} and {maximum}, got {value!r}')
+    return value
+
+def _require_str(name, value):
+    """Validate a non-empty string rule parameter"""
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError(f'{name} must be a non-empty string, got {value!r}')
+    return value
+
+def _require_str_list(name, value):
+    """Validate a non-empty list of non-empty strings"""
+    if not isinstance(value, list) or not value:
+        raise ValueError(f'{name} must be a non-empty list of strings, got {value!r}')
+    for item in value:
+        _require_str(f'{name} item', item)
+    return value
+
+
+def _compile_max_duration(max_days):
+    _require_int('max_days', max_days)
+
+    def check(ctx):
+        if ctx.duration > max_days:
+            return [f'Leave duration ({ctx.duration} days) exceeds {max_days} days']
+    pattern = r'Leave duration \(\d+ days\) exceeds '
+    return check, {'threshold': f'{max_days} days'}, pattern
+
+def _compile_keywords(keywords, label):
+    _require_str_list('keywords', keywords)
+    _require_str('label', label)
+    keywords = [kw.lower() for kw in keywords]
+
+    def check(ctx):
+        found_keywords = [kw for kw in keywords if kw in ctx.reason_lower]
+        if found_keywords:
+            return [f'Leave reason contains {label} keywords: {", ".join(found_keywords)}']
+    pattern = r'Leave reason contains .+ keywords: '
+    return check, {'keywords': list(keywords)}, pattern
+
+def _compile_monthly_limit(limit):
+    _require_int('limit', limit, minimum=1)
+
+    def check(ctx):
+        count = ctx.previous_leaves_count
+        if count >= limit:
+            return [f'Employee has already taken {count} leaves this month (limit: {limit})']
+    pattern = r'Employee has already taken \d+ leaves this month'
+    return check, {'threshold': f'{limit} leaves per month'}, pattern
+
+def _compile_weekday(day, field, verb):
+    if day not in WEEKDAYS:
+        raise ValueError(f'day must be one of {", ".join(WEEKDAYS)}, got {day!r}')
+    weekday = WEEKDAYS.index(day)
+
+    def check(ctx):
+        if getattr(ctx, field).weekday() == weekday:
+            return [f'Leave {verb} on {day} (potential long weekend extension)']
+    pattern = rf'Leave {verb} on \w+ \(potential long weekend'
+    return check, {'day': day}, pattern
+
+def _compile_brief_reason(keyword, min_length):
+    _require_str('keyword', keyword)
+    _require_int('min_length', min_length, minimum=1)
+    keyword = keyword.lower()
+
+    def check(ctx):
+        if keyword in ctx.reason_lower and len(ctx.reason) < min_length:
+            return [f'{keyword.capitalize()} leave reason is too brief '
+                    f'({len(ctx.reason)} characters, minimum: {min_length})']
+    pattern = r'\w+ leave reason is too brief '
+    return check, {'threshold': f'{min_length} characters minimum'}, pattern
+
+def _compile_department_duration(department, max_days):
+    _require_str('department', department)
+    _require_int('max_days', max_days)
+
+    def check(ctx):
+        if ctx.department == department and ctx.duration > max_days:
+            return [f'{department} department leave exceeds {max_days} days '
+                    f'(requested: {ctx.duration} days, limit: {max_days})']
+    pattern = r'.+ department leave exceeds \d+ days \(requested: '
+    return check, {'threshold': f'{max_days} days for {department}'}, pattern
+
+def _compile_holiday_proximity():
+    holidays = _parse_holidays(PUBLIC_HOLIDAYS)
+
+    def check(ctx):
+        return check_holiday_proximity(ctx.start, ctx.end, ctx.duration, holidays)
+    pattern = r'Leave (starts immediately after|ends immediately before|period includes) '
+    return check, {'check': 'Before, after, or during holidays'}, pattern
+
+# Similar-reason indexes by (CSV path, window_days, num_perm, bands, min_length)
+_similarity_indexes = weakref.WeakValueDictionary()
+
+def _compile_similar_reason(history_file, threshold, min_matches, window_days, date_range_days,
+                            min_length=20, num_perm=64, bands=16):
+    _require_str('history_file', history_file)
+    _require_number('threshold', threshold, 0, 1)
+    _require_int('min_matches', min_matches, minimum=1)
+    _require_int('window_days', window_days, minimum=1)
+    _require_int('date_range_days', date_range_days)
+    _require_int('min_length', min_length)
+    _require_int('num_perm', num_perm, minimum=1)
+    _require_int('bands', bands, minimum=1)
+    # Reused across rules reloads unless a setting that shapes the index
+    # changed; it is dropped once no compiled plan refers to it any more
+    key = (os.path.abspath(history_file), window_days, num_perm, bands, min_length)
+    index = _similarity_indexes.get(key)
+    if index is None:
+        index = ReasonSimilarityIndex(history_file, window_days, num_perm, bands, min_length)
+        _similarity_indexes[key] = index
+
+    def check(ctx):
+        if ctx.employee_id is None:
+            return None
+        matches = index.find_similar(ctx.reason, ctx.employee_id, ctx.start, threshold, date_range_days)
+        if len(matches) >= min_matches:
+            return [f'Leave reason closely matches reasons recently submitted by '
+                    f'{len(matches)} other employees']
+    pattern = r'Leave reason closely matches reasons recently submitted by '
+    return check, {'threshold': f'{threshold:.0%} similarity, {min_matches}+ employees within {window_days} days'}, pattern
+
+
+# Rule type -> (compiler, default cost)
+RULE_TYPES = {
+    'max_duration': (_compile_max_duration, COST_CHEAP),
+    'keywords': (_compile_keywords, COST_CHEAP),
+    'monthly_limit': (_compile_monthly_limit, COST_LOOKUP),
+    'start_weekday': (lambda day: _compile_weekday(day, 'start', 'starts'), COST_CHEAP),
+    'end_weekday': (lambda day: _compile_weekday(day, 'end', 'ends'), COST_CHEAP),
+    'brief_reason': (_compile_brief_reason, COST_CHEAP),
+    'department_duration': (_compile_department_duration, COST_CHEAP),
+    'holiday_proximity': (_compile_holiday_proximity, COST_LOOKUP),
+    'similar_reason': (_compile_similar_reason, COST_LOOKUP),
+}
+
+
+class RulePlan:
+    """
+    A compiled, ready-to-run set of rules
+
+    Checks are stored sorted by cost so expensive lookups run last, while
+    flags are reported in the order the rules are declared in the config.
+    """
+
+    def __init__(self, steps, info, flag_patterns):
+        self.steps = steps
+        self.info = info
+        self.flag_patterns = flag_patterns
+
+    def evaluate(self, ctx):
+        """
+        Run every rule against a request context
+
+        Returns:
+            tuple: (list of flag messages, list of triggered rule ids)
+        """
+        hits = []
+        for position, rule_id, check in self.steps:
+            rule_flags = check(ctx)
+            if rule_flags:
+                hits.append((position, rule_id, rule_flags))
+        hits.sort(key=lambda hit: hit[0])
+
+        flags = []
+        rules_triggered = []
+        for _, rule_id, rule_flags in hits:
+            flags.extend(rule_flags)
+            rules_triggered.append(rule_id)
+        return flags, rules_triggered
+
+    def rules_in_record(self, row):
+        """
+        Get the ids of the rules that flagged a stored CSV row
+
+        Rows are saved with the triggered rule ids in their Rules column, so
+        editing a rule's parameters never changes how earlier rows are
+        attributed. Rows saved before that column existed leave it empty and
+        fall back to matching their Flags text (see rules_in_flags).
+
+        Args:
+            row (dict): CSV row as read by csv.DictReader
+
+        Returns:
+            set: Rule ids (as strings)
+        """
+        if row['Status'] != 'Flagged':
+            return set()
+        rule_ids = row.get('Rules')
+        if rule_ids:
+            return set(rule_ids.split('; '))
+        return self.rules_in_flags(row['Flags'])
+
+    def rules_in_flags(self, flags_text):
+        """
+        Recover the ids of the rules behind a stored Flags column
+
+        Only needed for rows saved without a Rules column. Flag patterns do
+        not depend on rule parameters, so a message is attributed to every
+        enabled rule of the type that produces it.
+
+        Args:
+            flags_text (str): '; '-joined flag messages as saved in the CSV
+
+        Returns:
+            set: Rule ids (as strings) whose messages appear in flags_text
+        """
+        found = set()
+        if not flags_text:
+            return found
+        for flag in flags_text.split('; '):
+            for rule_id, pattern in self.flag_patterns.items():
+                if pattern.match(flag):
+                    found.add(rule_id)
+        return found
+
+
+def compile_rules(config):
+    """
+    Compile a rules config dict into a RulePlan
+
+    Args:
+        config (dict): Parsed rules config ({'rules': [...]})
+
+    Returns:
+        RulePlan: The compiled plan
+
+    Raises:
+        ValueError: If a rule is malformed or has an unknown type
+    """
+    steps = []
+    info = {}
+    flag_patterns = {}
+    rules = config.get('rules', []) if isinstance(config, dict) else None
+    if not isinstance(rules, list):
+        raise ValueError('Rules config must be an object with a "rules" list')
+
+    for position, rule in enumerate(rules):
+        if not isinstance(rule, dict):
+            raise ValueError(f'Invalid rule definition: {rule!r}')
+        if not rule.get('enabled', True):
+            continue
+        rule_id = rule.get('id')
+        rule_type = rule.get('type')
+        if rule_id is None or rule_type not in RULE_TYPES:
+            raise ValueError(f'Invalid rule definition: {rule!r}')
+
+        compiler, default_cost = RULE_TYPES[rule_type]
+        params = rule.get('params', {})
+        if not isinstance(params, dict):
+            raise ValueError(f'params for rule {rule_id} must be an object')
+        try:
+            check, details, pattern = compiler(**params)
+            cost = _require_number('cost', rule.get('cost', default_cost), 0, float('inf'))
+            description = rule.get('description', '').format(**params)
+        except (TypeError, ValueError, KeyError, IndexError, AttributeError) as e:
+            raise ValueError(f'Invalid parameters for rule {rule_id}: {e}') from e
+
+        steps.append((position, rule_id, check, cost))
+        flag_patterns[str(rule_id)] = re.compile(pattern)
+        info[f'rule_{rule_id}'] = {
+            'name': rule.get('name', f'Rule {rule_id}'),
+            'description': description,
+            **details
         }
-    }
\ No newline at end of file
+
+    # Stable sort keeps declaration order among rules of equal cost
+    steps.sort(key=lambda step: step[3])
+    return RulePlan([step[:3] for step in steps], info, flag_patterns)
+
+
+_rule_plan = None
+_rule_plan_mtime = None
+_rule_plan_lock = threading.Lock()
+_reload_callbacks = []
+
+def register_rules_reload_callback(callback):
+    """
+    Register a zero-argument callable invoked whenever the rule plan is
+    recompiled, so caches that depend on rule outcomes can be invalidated.
+    """
+    _reload_callbacks.append(callback)
+    return callback
+
+def get_rule_plan():
+    """
+    Get the current rule plan, recompiling it if the config file changed
+
+    If a changed config fails to load, the previous plan stays active.
+    """
+    global _rule_plan, _rule_plan_mtime
+
+    try:
+        mtime = os.stat(RULES_CONFIG_FILE).st_mtime_ns
+    except OSError:
+        mtime = None
+    if _rule_plan is not None and mtime == _rule_plan_mtime:
+        return _rule_plan
+
+    with _rule_plan_lock:
+        if _rule_plan is not None and mtime == _rule_plan_mtime:
+            return _rule_plan
+        try:
+            with open(RULES_CONFIG_FILE, 'r', encoding='utf-8') as f:
+                plan = compile_rules(json.load(f))
+        except (OSError, ValueError) as e:
+            if _rule_plan is None:
+                raise
+            print(f"Error reloading rules config, keeping previous rules: {e}")
+            _rule_plan_mtime = mtime
+            return _rule_plan
+        reloaded = _rule_plan is not None
+        _rule_plan = plan
+        _rule_plan_mtime = mtime
+
+    if reloaded:
+        for callback in list(_reload_callbacks):
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error in rules reload callback: {e}")
+    return plan
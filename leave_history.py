@@ -0,0 +1,444 @@
+"""
+Indexed, cursor-paginated access to the leave request history
+
+The CSV is scanned once to build in-memory secondary indexes (employee,
+department, status, name). Only the fields needed for filtering and the byte
+offset of each record are kept in memory; full rows are read back from the CSV
+for the records on the requested page. New rows appended to the CSV (by this
+or any other worker) are picked up incrementally on the next query.
+"""
+
+import base64
+import bisect
+import csv
+import heapq
+import os
+import threading
+
+# Maximum number of records a single page may return
+MAX_PAGE_SIZE = 100
+DEFAULT_PAGE_SIZE = 25
+
+# Maximum number of index entries examined per page, so that a very selective
+# filter (e.g. a date range far in the past) cannot turn into a full scan
+MAX_SCAN_PER_PAGE = 5000
+
+# A name prefix matching more employees than this is not worth merging one
+# posting list per employee; the search falls back to a budgeted scan instead
+MAX_MERGED_POSTINGS = 64
+
+# When the indexed filters leave more than this fraction of all records as
+# candidates, reading the CSV sequentially is cheaper than seeking to each row
+MAX_SEEK_FRACTION = 0.5
+
+
+class _Record:
+    """Compact in-memory entry for one CSV row"""
+
+    __slots__ = ('key', 'offset', 'employee_id', 'name', 'department',
+                 'status', 'start_date', 'end_date')
+
+    def __init__(self, key, offset, row):
+        self.key = key
+        self.offset = offset
+        self.employee_id = row['Employee ID']
+        self.name = row['Employee Name'].lower()
+        self.department = row['Department']
+        self.status = row['Status']
+        self.start_date = row['Start Date']
+        self.end_date = row['End Date']
+
+
+def encode_cursor(key):
+    """Encode a (timestamp, sequence) key as an opaque URL-safe cursor"""
+    raw = f"{key[0]}|{key[1]}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        timestamp, seq = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').rsplit('|', 1)
+        return (timestamp, int(seq))
+    except (UnicodeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def _iter_descending(posting, end):
+    """Iterate posting[:end] newest first without copying the list"""
+    for i in range(end - 1, -1, -1):
+        yield posting[i]
+
+
+class CsvTail:
+    """
+    Incrementally reads rows appended to a CSV file
+
+    Remembers the byte offset just after the last complete row, so each read
+    only parses what was appended since (by this or any other process).
+    """
+
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self.reset()
+
+    def reset(self):
+        """Forget everything read so far; the next read starts from the header"""
+        self.offset = 0
+        self.fieldnames = None
+        self._file_id = None
+
+    def poll(self):
+        """
+        Check the file for changes without reading it
+
+        Returns:
+            str: 'unchanged', 'appended', or 'truncated' if the file shrank,
+            disappeared or was replaced (call reset() before reading again)
+        """
+        try:
+            st = os.stat(self.csv_path)
+        except OSError:
+            return 'truncated' if self.offset else 'unchanged'
+        size = st.st_size
+        if size < self.offset or (self._file_id is not None and self._file_id != (st.st_dev, st.st_ino)):
+            return 'truncated'
+        return 'appended' if size > self.offset else 'unchanged'
+
+    def skip_to(self, offset):
+        """
+        Move the read position forward to offset, which must be the start of
+        a row. The header is read first if it has not been yet.
+        """
+        if self.fieldnames is None:
+            try:
+                with open(self.csv_path, 'rb') as f:
+                    header = f.readline()
+                    st = os.fstat(f.fileno())
+            except OSError:
+                return
+            if not header.endswith(b'\n'):
+                return
+            self.fieldnames = next(csv.reader([header.decode('utf-8', errors='replace')]))
+            self.offset = len(header)
+            self._file_id = (st.st_dev, st.st_ino)
+        self.offset = max(self.offset, offset)
+
+    def read_new_rows(self):
+        """
+        Yield (byte offset, row dict) for every complete row appended since the
+        last read. A partially written last row is left for the next read;
+        blank rows are skipped and malformed or non-UTF-8 rows are logged and
+        skipped.
+        """
+        try:
+            f = open(self.csv_path, 'rb')
+        except OSError:
+            return
+
+        with f:
+            f.seek(self.offset)
+            position = self.offset
+            line_complete = True
+            held_back = False
+            undecodable = False
+
+            def lines():
+                nonlocal position, line_complete, held_back, undecodable
+                for line in f:
+                    line_complete = line.endswith(b'\n')
+                    try:
+                        text = line.decode('utf-8')
+                    except UnicodeDecodeError:
+                        if not line_complete:
+                            # Most likely a multibyte character cut off by a
+                            # write in progress; leave it for the next read
+                            held_back = True
+                            return
+                        # Passed on as a blank line and skipped below
+                        undecodable = True
+                        text = '\n'
+                    position += len(line)
+                    yield text
+
+            reader = csv.reader(lines())
+            if self.fieldnames is None:
+                fieldnames = next(reader, None)
+                if fieldnames is None or not line_complete or held_back:
+                    return
+                self.fieldnames = fieldnames
+                self.offset = position
+                st = os.fstat(f.fileno())
+                self._file_id = (st.st_dev, st.st_ino)
+
+            while True:
+                record_start = position
+                undecodable = False
+                values = next(reader, None)
+                if values is None:
+                    break
+                if len(values) != len(self.fieldnames) or not line_complete or undecodable:
+                    # A row still being written ends at EOF without a newline
+                    # (or mid-quote); hold it back for the next read
+                    if held_back or (position >= os.fstat(f.fileno()).st_size
+                                     and (values or not line_complete)):
+                        break
+                    if undecodable:
+                        print(f"Skipping row that is not valid UTF-8 at byte {record_start} of {self.csv_path}")
+                    elif values:
+                        print(f"Skipping malformed row at byte {record_start} of {self.csv_path}")
+                    self.offset = position
+                    continue
+                self.offset = position
+                yield record_start, dict(zip(self.fieldnames, values))
+
+
+class LeaveHistoryIndex:
+    """
+    Secondary indexes over the leave requests CSV
+
+    Every posting list holds (timestamp, sequence) keys in ascending order,
+    where sequence is the row's position in the file. Pages are returned
+    newest first and resume from a cursor by bisecting into the posting list,
+    so any page costs the same as the first one.
+    """
+
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self._tail = CsvTail(csv_path)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._tail.reset()
+        self._records = {}
+        self._all = []
+        self._by_employee = {}
+        self._by_department = {}
+        self._by_status = {}
+        self._names = []  # sorted (lowercase name, employee_id) pairs
+        self._name_set = set()
+
+    def refresh(self):
+        """Index any rows appended since the last refresh (or rebuild if the file shrank)"""
+        if self._tail.poll() == 'unchanged':
+            return
+
+        with self._lock:
+            change = self._tail.poll()
+            if change == 'truncated':
+                self._reset()
+            elif change == 'unchanged':
+                return
+
+            unsorted = {}
+            new_names = set()
+            for offset, row in self._tail.read_new_rows():
+                record = _Record((row['Timestamp'], len(self._records)), offset, row)
+                self._add(record, unsorted)
+                new_names.add((record.name, record.employee_id))
+            for posting in unsorted.values():
+                posting.sort()
+
+            # Bulk loads are sorted once per batch; a few new names from
+            # routine appends are cheaper to insert in place
+            new_names -= self._name_set
+            self._name_set |= new_names
+            if len(new_names) <= MAX_MERGED_POSTINGS:
+                for name_entry in new_names:
+                    bisect.insort(self._names, name_entry)
+            else:
+                self._names.extend(new_names)
+                self._names.sort()
+
+    def _add(self, record, unsorted):
+        self._records[record.key[1]] = record
+        for posting in (self._all,
+                        self._by_employee.setdefault(record.employee_id, []),
+                        self._by_department.setdefault(record.department, []),
+                        self._by_status.setdefault(record.status, [])):
+            # Rows are usually appended in timestamp order; anything else is
+            # sorted once at the end of the batch rather than inserted in place
+            if posting and posting[-1] > record.key:
+                unsorted[id(posting)] = posting
+            posting.append(record.key)
+
+    def _employees_with_name_prefix(self, prefix, limit):
+        """Employee IDs whose name starts with prefix, or None if there are more than limit"""
+        prefix = prefix.lower()
+        i = bisect.bisect_left(self._names, (prefix,))
+        employee_ids = set()
+        while i < len(self._names) and self._names[i][0].startswith(prefix):
+            employee_ids.add(self._names[i][1])
+            if len(employee_ids) > limit:
+                return None
+            i += 1
+        return employee_ids
+
+    def _candidate_postings(self, filters):
+        """Pick the smallest set of posting lists that covers every possible match"""
+        options = [[self._all]]
+        if 'Employee ID' in filters:
+            options.append([self._by_employee.get(filters['Employee ID'], [])])
+        if 'name' in filters:
+            employee_ids = self._employees_with_name_prefix(filters['name'], MAX_MERGED_POSTINGS)
+            if employee_ids is not None:
+                options.append([self._by_employee[employee_id] for employee_id in employee_ids])
+        if 'Department' in filters:
+            options.append([self._by_department.get(filters['Department'], [])])
+        if 'Status' in filters:
+            options.append([self._by_status.get(filters['Status'], [])])
+        return min(options, key=lambda postings: sum(len(p) for p in postings))
+
+    def _matches(self, record, filters):
+        if 'Employee ID' in filters and record.employee_id != filters['Employee ID']:
+            return False
+        if 'Department' in filters and record.department != filters['Department']:
+            return False
+        if 'Status' in filters and record.status != filters['Status']:
+            return False
+        if 'name' in filters and not record.name.startswith(filters['name'].lower()):
+            return False
+        if 'start_date' in filters and record.end_date < filters['start_date']:
+            return False
+        if 'end_date' in filters and record.start_date > filters['end_date']:
+            return False
+        return True
+
+    def offset_since(self, timestamp):
+        """
+        Get a byte offset in the CSV after which every row with a Timestamp
+        at or after timestamp is found, so readers that only want recent rows
+        can skip the rest of the file
+
+        Returns:
+            int: Start of the earliest such row, or the end of the rows read
+                so far if there are none
+        """
+        self.refresh()
+        with self._lock:
+            i = bisect.bisect_left(self._all, (timestamp,))
+            if i == len(self._all):
+                return self._tail.offset
+            # Sequence numbers follow the file, so the smallest one comes first
+            return self._records[min(key[1] for key in self._all[i:])].offset
+
+    def _read_row(self, f, offset):
+        f.seek(offset)
+
+        def lines():
+            for line in f:
+                # Indexed rows decoded cleanly when read; never fail a page
+                # if the file changed since
+                yield line.decode('utf-8', errors='replace')
+
+        return dict(zip(self._tail.fieldnames, next(csv.reader(lines()))))
+
+    def _read_rows(self, offsets):
+        with open(self.csv_path, 'rb') as f:
+            for offset in offsets:
+                yield self._read_row(f, offset)
+
+    def iter_matching_rows(self, filters):
+        """
+        Stream every record matching the indexed filters, in file order
+
+        Only the employee, department, status, name and date filters are
+        applied; callers check any other filter on the returned rows.
+
+        Args:
+            filters (dict): Filters as built by parse_leave_filters in app.py
+
+        Returns:
+            iterator: CSV rows as dicts, or None if the filters are not
+                selective enough to beat a sequential scan of the CSV
+        """
+        self.refresh()
+        with self._lock:
+            postings = self._candidate_postings(filters)
+            candidates = sum(len(p) for p in postings)
+            if postings[0] is self._all or candidates > len(self._all) * MAX_SEEK_FRACTION:
+                return None
+
+            # Sequence numbers follow the file, so sorting them restores file order
+            seqs = sorted(key[1] for posting in postings for key in posting
+                          if self._matches(self._records[key[1]], filters))
+            offsets = [self._records[seq].offset for seq in seqs]
+        return self._read_rows(offsets)
+
+    def search(self, filters, cursor=None, page_size=DEFAULT_PAGE_SIZE, row_filter=None):
+        """
+        Get one page of leave records, newest first
+
+        At most MAX_SCAN_PER_PAGE index entries are examined per call, so a
+        page may hold fewer than page_size records while next_cursor is still
+        set; keep following the cursor until it is None.
+
+        Args:
+            filters (dict): Filters as built by parse_leave_filters in app.py
+            cursor (str): next_cursor from the previous page, or None
+            page_size (int): Number of records wanted (capped at MAX_PAGE_SIZE)
+            row_filter (callable): Optional extra check on the full CSV row,
+                for filters the index does not cover
+
+        Returns:
+            dict: {
+                'records': list of CSV rows as dicts,
+                'next_cursor': cursor for the following page, or None at the end
+            }
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+        after = decode_cursor(cursor) if cursor else None
+
+        self.refresh()
+        rows = []
+        next_key = None
+        with self._lock:
+            if not self._records:
+                return {'records': rows, 'next_cursor': None}
+
+            streams = []
+            for posting in self._candidate_postings(filters):
+                end = bisect.bisect_left(posting, after) if after else len(posting)
+                streams.append(_iter_descending(posting, end))
+
+            scanned = 0
+            with open(self.csv_path, 'rb') as f:
+                for key in heapq.merge(*streams, reverse=True):
+                    scanned += 1
+                    record = self._records[key[1]]
+                    if self._matches(record, filters):
+                        row = self._read_row(f, record.offset)
+                        if row_filter is None or row_filter(row):
+                            rows.append(row)
+                            if len(rows) == page_size:
+                                next_key = key
+                                break
+                    if scanned >= MAX_SCAN_PER_PAGE:
+                        next_key = key
+                        break
+
+        return {
+            'records': rows,
+            'next_cursor': encode_cursor(next_key) if next_key else None
+        }
+
+
+_shared_indexes = {}
+_shared_indexes_lock = threading.Lock()
+
+def get_history_index(csv_path):
+    """Get the LeaveHistoryIndex shared by every user of csv_path in this process"""
+    key = os.path.abspath(csv_path)
+    with _shared_indexes_lock:
+        index = _shared_indexes.get(key)
+        if index is None:
+            index = _shared_indexes[key] = LeaveHistoryIndex(csv_path)
+        return index
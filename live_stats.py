@@ -0,0 +1,199 @@
+"""
+Shared, incrementally maintained leave statistics with push updates
+
+One LiveStats instance per worker keeps running aggregates over the leave
+requests CSV, reading only rows appended since the last refresh. A single
+background thread publishes the changes to every subscriber (e.g. the
+/stats/stream Server-Sent Events endpoint) at most once per interval, so the
+cost of live dashboards does not grow with the number of viewers.
+"""
+
+import os
+import queue
+import threading
+import time
+
+from leave_analyzer import get_rule_plan
+from leave_history import CsvTail
+
+# Minimum seconds between pushed updates (override with STATS_STREAM_INTERVAL)
+DEFAULT_STREAM_INTERVAL = 2.0
+try:
+    STATS_STREAM_INTERVAL = float(os.environ.get('STATS_STREAM_INTERVAL', DEFAULT_STREAM_INTERVAL))
+    if not 0 < STATS_STREAM_INTERVAL < float('inf'):
+        raise ValueError
+except ValueError:
+    print(f"Invalid STATS_STREAM_INTERVAL, using {DEFAULT_STREAM_INTERVAL}")
+    STATS_STREAM_INTERVAL = DEFAULT_STREAM_INTERVAL
+
+# Seconds of silence after which a stream sends a keepalive comment
+KEEPALIVE_INTERVAL = 15
+
+# Pending events per subscriber before it is resynced with a full snapshot
+SUBSCRIBER_QUEUE_SIZE = 16
+
+
+class LiveStats:
+    """
+    Running leave request aggregates: totals, approval rate, unique employees,
+    requests per department and flags per rule
+    """
+
+    def __init__(self, csv_path, interval=STATS_STREAM_INTERVAL):
+        self.interval = interval
+        self._tail = CsvTail(csv_path)
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._subscribers_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._published = None
+        self._reset_counts()
+
+    def _reset_counts(self):
+        self._tail.reset()
+        self._total = 0
+        self._approved = 0
+        self._flagged = 0
+        self._employees = set()
+        self._departments = {}
+        self._rules = {}
+
+    def refresh(self):
+        """Fold rows appended to the CSV since the last refresh into the aggregates"""
+        if self._tail.poll() == 'unchanged':
+            return
+
+        # Only rows saved without rule ids need the plan to attribute their
+        # flags; counts already folded in are never recomputed on a reload
+        plan = get_rule_plan()
+        with self._lock:
+            if self._tail.poll() == 'truncated':
+                self._reset_counts()
+            for _, row in self._tail.read_new_rows():
+                self._total += 1
+                if row['Status'] == 'Approved':
+                    self._approved += 1
+                elif row['Status'] == 'Flagged':
+                    self._flagged += 1
+                self._employees.add(row['Employee ID'])
+                self._departments[row['Department']] = self._departments.get(row['Department'], 0) + 1
+                for rule_id in plan.rules_in_record(row):
+                    self._rules[rule_id] = self._rules.get(rule_id, 0) + 1
+
+    def snapshot(self):
+        """
+        Get the current statistics
+
+        Returns:
+            dict: Same keys as the /stats page uses, plus 'rules'
+                (rule id -> number of requests flagged by it)
+        """
+        self.refresh()
+        with self._lock:
+            return {
+                'total_requests': self._total,
+                'approved': self._approved,
+                'flagged': self._flagged,
+                'approval_rate': round((self._approved / self._total * 100), 1) if self._total > 0 else 0,
+                'unique_employees': len(self._employees),
+                'departments': dict(self._departments),
+                'rules': dict(self._rules)
+            }
+
+    def notify(self):
+        """Signal that new rows were appended; the next push happens within one interval"""
+        self._wakeup.set()
+
+    def subscribe(self):
+        """
+        Register a subscriber
+
+        Returns:
+            queue.Queue: Receives (event, data) tuples, starting with a
+            ('snapshot', stats) event followed by ('delta', changes) events
+        """
+        current = self.snapshot()
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        subscriber.put(('snapshot', current))
+        with self._subscribers_lock:
+            # Deltas carry absolute values, so a baseline older than this
+            # subscriber's snapshot is harmless
+            if self._published is None:
+                self._published = current
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='live-stats', daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._subscribers_lock:
+            self._subscribers.discard(subscriber)
+
+    def _run(self):
+        last_publish = time.monotonic()
+        while True:
+            self._wakeup.wait(self.interval)
+            # Coalesce bursts of submissions into one update per interval
+            delay = self.interval - (time.monotonic() - last_publish)
+            if delay > 0:
+                time.sleep(delay)
+            self._wakeup.clear()
+            last_publish = time.monotonic()
+
+            with self._subscribers_lock:
+                if not self._subscribers:
+                    self._thread = None
+                    self._published = None
+                    return
+                subscribers = list(self._subscribers)
+
+            try:
+                self._publish(subscribers)
+            except Exception as e:
+                print(f"Error publishing live stats: {e}")
+
+    def _publish(self, subscribers):
+        current = self.snapshot()
+        previous = self._published
+        self._published = current
+        if previous is None:
+            return
+
+        event = _diff(previous, current)
+        if event is None:
+            return
+
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # Slow reader: replace its backlog with one full snapshot
+                while True:
+                    try:
+                        subscriber.get_nowait()
+                    except queue.Empty:
+                        break
+                subscriber.put_nowait(('snapshot', current))
+
+
+def _diff(previous, current):
+    """
+    Build the event that takes a subscriber from previous to current
+
+    Returns:
+        tuple: ('delta', changed values), ('snapshot', current) if counts were
+        reset, or None if nothing changed
+    """
+    delta = {}
+    for key, value in current.items():
+        if isinstance(value, dict):
+            if previous[key].keys() - value.keys():
+                return ('snapshot', current)
+            changed = {k: v for k, v in value.items() if previous[key].get(k) != v}
+            if changed:
+                delta[key] = changed
+        elif previous[key] != value:
+            delta[key] = value
+    return ('delta', delta) if delta else None
@@ -0,0 +1,170 @@
+"""
+Near-duplicate leave reason detection with MinHash and locality-sensitive hashing
+
+Each reason is reduced to a MinHash signature over its character shingles.
+Signatures are split into bands and bucketed by band, so a new reason is only
+compared against reasons sharing at least one bucket instead of every stored
+reason. Only requests submitted within a sliding time window are kept; older
+entries are evicted as the window moves, and the first fill skips straight to
+the window start using the shared leave history index.
+"""
+
+import hashlib
+import heapq
+import random
+import re
+import threading
+from datetime import datetime, timedelta
+
+from leave_history import CsvTail, get_history_index
+
+# Characters per shingle; short enough to survive light edits
+SHINGLE_SIZE = 4
+
+# Large prime for the (a * x + b) mod p hash family
+_PRIME = (1 << 61) - 1
+
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def _shingle_hashes(text):
+    """Hash the character shingles of a normalised reason"""
+    normalised = ' '.join(_WORD_RE.findall(text.lower()))
+    if len(normalised) <= SHINGLE_SIZE:
+        shingles = {normalised}
+    else:
+        shingles = {normalised[i:i + SHINGLE_SIZE] for i in range(len(normalised) - SHINGLE_SIZE + 1)}
+    return [int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'big')
+            for s in shingles]
+
+
+class ReasonSimilarityIndex:
+    """
+    Sliding-window MinHash/LSH index over the reasons in the leave requests CSV
+
+    Args:
+        csv_path (str): Leave requests CSV to read submitted reasons from
+        window_days (int): How long a submitted reason stays in the index
+        num_perm (int): MinHash signature length
+        bands (int): Number of LSH bands; must divide num_perm. More bands
+            find lower-similarity candidates at the cost of more comparisons
+        min_length (int): Reasons shorter than this are ignored, as short
+            reasons like "Sick" legitimately repeat
+    """
+
+    def __init__(self, csv_path, window_days=14, num_perm=64, bands=16, min_length=20):
+        if num_perm % bands:
+            raise ValueError('num_perm must be a multiple of bands')
+        self.window = timedelta(days=window_days)
+        self.rows_per_band = num_perm // bands
+        self.bands = bands
+        self.min_length = min_length
+
+        # Fixed seed so signatures are comparable across reloads and workers
+        rng = random.Random(1)
+        self._perms = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+
+        self._tail = CsvTail(csv_path)
+        self._history = get_history_index(csv_path)
+        self._lock = threading.Lock()
+        self._entries = {}  # entry id -> (employee_id, start date ordinal, signature)
+        self._expiry = []   # heap of (timestamp, entry id)
+        self._buckets = [{} for _ in range(bands)]
+        self._next_id = 0
+
+    def signature(self, text):
+        """MinHash signature of a reason"""
+        hashes = _shingle_hashes(text)
+        return tuple(min([(a * h + b) % _PRIME for h in hashes]) for a, b in self._perms)
+
+    def _band_keys(self, signature):
+        r = self.rows_per_band
+        return [hash(signature[i * r:(i + 1) * r]) for i in range(self.bands)]
+
+    def _add(self, timestamp, employee_id, reason, start_date):
+        try:
+            start = datetime.strptime(start_date, '%Y-%m-%d').toordinal()
+        except ValueError:
+            return
+        signature = self.signature(reason)
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (employee_id, start, signature)
+        heapq.heappush(self._expiry, (timestamp, entry_id))
+        for buckets, key in zip(self._buckets, self._band_keys(signature)):
+            buckets.setdefault(key, set()).add(entry_id)
+
+    def _evict(self, cutoff):
+        while self._expiry and self._expiry[0][0] < cutoff:
+            _, entry_id = heapq.heappop(self._expiry)
+            _, _, signature = self._entries.pop(entry_id)
+            for buckets, key in zip(self._buckets, self._band_keys(signature)):
+                bucket = buckets[key]
+                bucket.discard(entry_id)
+                if not bucket:
+                    del buckets[key]
+
+    def _reset(self):
+        self._tail.reset()
+        self._entries.clear()
+        self._expiry.clear()
+        for buckets in self._buckets:
+            buckets.clear()
+
+    def refresh(self, now=None):
+        """Add reasons appended to the CSV since the last refresh and evict expired ones"""
+        with self._lock:
+            self._refresh(now)
+
+    def _refresh(self, now):
+        cutoff = ((now or datetime.now()) - self.window).strftime('%Y-%m-%d %H:%M:%S')
+        change = self._tail.poll()
+        if change == 'truncated':
+            self._reset()
+        if self._tail.fieldnames is None:
+            # First fill: start at the window instead of the oldest request
+            self._tail.skip_to(self._history.offset_since(cutoff))
+        if change != 'unchanged':
+            for _, row in self._tail.read_new_rows():
+                # Timestamps share one fixed format, so they compare as strings
+                if row['Timestamp'] >= cutoff and len(row['Reason']) >= self.min_length:
+                    self._add(row['Timestamp'], row['Employee ID'], row['Reason'], row['Start Date'])
+        self._evict(cutoff)
+
+    def find_similar(self, reason, employee_id, start, threshold, date_range_days, now=None):
+        """
+        Find other employees who recently submitted a near-identical reason
+
+        Args:
+            reason (str): Reason of the request being analysed
+            employee_id (str): Submitting employee, excluded from the matches
+            start (datetime): Leave start date of the request
+            threshold (float): Minimum estimated Jaccard similarity (0-1)
+            date_range_days (int): Maximum distance between leave start dates
+            now (datetime): Current time, for the sliding window
+
+        Returns:
+            set: Employee IDs with a matching reason
+        """
+        if len(reason) < self.min_length:
+            return set()
+
+        signature = self.signature(reason)
+        start = start.toordinal()
+        matches = set()
+        with self._lock:
+            self._refresh(now)
+            candidates = set()
+            for buckets, key in zip(self._buckets, self._band_keys(signature)):
+                candidates.update(buckets.get(key, ()))
+
+            for entry_id in candidates:
+                other_employee, other_start, other_signature = self._entries[entry_id]
+                if other_employee == employee_id or other_employee in matches:
+                    continue
+                if abs(other_start - start) > date_range_days:
+                    continue
+                same = sum(1 for x, y in zip(signature, other_signature) if x == y)
+                if same / len(signature) >= threshold:
+                    matches.add(other_employee)
+        return matches
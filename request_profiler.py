@@ -0,0 +1,169 @@
+"""
+Opt-in profiling of individual Flask requests
+
+Disabled by default. When PROFILE_REQUESTS is not set, init_profiling()
+returns without touching the app, so there is no per-request overhead.
+
+Environment variables:
+    PROFILE_REQUESTS      Set to 1 to enable the hook
+    PROFILE_SAMPLE_RATE   Fraction of requests to profile, 0.0-1.0 (default 0:
+                          only requests sent with the X-Profile: 1 header)
+    PROFILE_MODE          'cprofile' writes .prof files for pstats or snakeviz;
+                          'sampler' writes collapsed stacks (.folded) ready for
+                          flamegraph.pl or speedscope (default: 'sampler' on
+                          Python 3.12+, 'cprofile' before)
+    PROFILE_DIR           Output directory (default: profiles)
+    PROFILE_ENDPOINTS     Comma-separated view names to profile
+                          (default: submit_leave,statistics,check_employee)
+
+On Python 3.12+ cProfile is built on sys.monitoring, which is process-wide:
+while one request is profiled, every thread's calls are recorded, so under a
+threaded server (including the Flask development server) a .prof file also
+contains whatever other requests ran at the same time. The sampler only walks
+the profiled request's own thread and is unaffected, hence the default.
+"""
+
+import cProfile
+import functools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import request
+
+PROFILE_HEADER = 'X-Profile'
+DEFAULT_ENDPOINTS = 'submit_leave,statistics,check_employee'
+
+# Seconds between stack samples in 'sampler' mode; requests that finish
+# before the first sample lands are logged instead of written out
+SAMPLER_INTERVAL = 0.005
+
+# cProfile cannot isolate one thread on 3.12+ (see the module docstring)
+DEFAULT_MODE = 'sampler' if sys.version_info >= (3, 12) else 'cprofile'
+
+
+class _StackSampler:
+    """Samples one thread's call stack on a background thread"""
+
+    def __init__(self, thread_id, interval=SAMPLER_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        # Sample straight away so short requests still get a chance to be seen
+        while True:
+            self._sample()
+            if self._stop.wait(self.interval):
+                return
+
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            if code.co_filename == __file__:
+                # The thread is in start() or stop() rather than the view
+                if code.co_name != 'wrapper':
+                    return
+            else:
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        if stack:
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _output_path(directory, endpoint, elapsed, extension):
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    return os.path.join(directory, f"{endpoint}-{stamp}-{os.getpid()}-{elapsed * 1000:.0f}ms.{extension}")
+
+def _profiled(view, endpoint, sample_rate, mode, directory):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.headers.get(PROFILE_HEADER) != '1' and random.random() >= sample_rate:
+            return view(*args, **kwargs)
+
+        if mode == 'sampler':
+            profiler = _StackSampler(threading.get_ident())
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another request on this process is already being profiled
+                return view(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return view(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            try:
+                if mode == 'sampler':
+                    profiler.stop()
+                    if profiler.stacks:
+                        profiler.write(_output_path(directory, endpoint, elapsed, 'folded'))
+                    else:
+                        print(f"Profiling: {endpoint} took {elapsed * 1000:.1f}ms, too short to "
+                              f"sample every {SAMPLER_INTERVAL * 1000:g}ms; no profile written")
+                else:
+                    profiler.disable()
+                    profiler.dump_stats(_output_path(directory, endpoint, elapsed, 'prof'))
+            except Exception as e:
+                print(f"Error writing profile for {endpoint}: {e}")
+    return wrapper
+
+def init_profiling(app):
+    """
+    Wrap the configured view functions with the profiling hook, if enabled
+
+    Must be called after the routes are registered.
+
+    Returns:
+        bool: True if profiling was enabled
+    """
+    if os.environ.get('PROFILE_REQUESTS', '').strip().lower() not in ('1', 'true', 'yes'):
+        return False
+
+    try:
+        sample_rate = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+    except ValueError:
+        sample_rate = 0.0
+    mode = os.environ.get('PROFILE_MODE', '').strip().lower() or DEFAULT_MODE
+    if mode not in ('cprofile', 'sampler'):
+        print(f"Unknown PROFILE_MODE '{mode}', using {DEFAULT_MODE}")
+        mode = DEFAULT_MODE
+    if mode == 'cprofile' and sys.version_info >= (3, 12):
+        print("Profiling: on Python 3.12+ cProfile records all threads, so profiles "
+              "include concurrent requests; use PROFILE_MODE=sampler to isolate them")
+    directory = os.environ.get('PROFILE_DIR', 'profiles')
+    os.makedirs(directory, exist_ok=True)
+
+    endpoints = [e.strip() for e in os.environ.get('PROFILE_ENDPOINTS', DEFAULT_ENDPOINTS).split(',') if e.strip()]
+    for endpoint in endpoints:
+        view = app.view_functions.get(endpoint)
+        if view is None:
+            print(f"Profiling: no view named '{endpoint}', skipping")
+            continue
+        app.view_functions[endpoint] = _profiled(view, endpoint, sample_rate, mode, directory)
+
+    print(f"Profiling enabled ({mode}, sample rate {sample_rate}) -> {directory}/")
+    return True